@@ -7,12 +7,22 @@ from pytz import timezone
 import re
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# Version of the get_data_df output schema. Increase it whenever the parser output changes
+# so that cached frames built by an older parser are not reused.
+PARSER_VERSION = 3
+
+# Run expectancy for the rest of the inning by outs (rows) and base state (columns), 2010-2015 MLB average.
+# The base state is a bitmask of the occupied bases: 1 = first, 2 = second, 4 = third.
+RE24 = [[0.481, 0.859, 1.100, 1.437, 1.350, 1.784, 1.964, 2.292],
+        [0.254, 0.509, 0.664, 0.884, 0.950, 1.130, 1.376, 1.541],
+        [0.098, 0.224, 0.319, 0.429, 0.353, 0.478, 0.580, 0.752]]
+
 
 class MLB_Scrape:
 
     def __init__(self):
-        # Initialize your class here if needed
-        pass
+        # Game headers (date and teams) used to complete playByPlay documents, keyed by game ID
+        self.game_headers = {}
 
     def get_sport_id(self):
         """
@@ -69,7 +79,9 @@ class MLB_Scrape:
     def get_schedule(self,
                     year_input: list = [2024],
                     sport_id: list = [1],
-                    game_type: list = ['R']):
+                    game_type: list = ['R'],
+                    start_date: str = None,
+                    end_date: str = None):
         
         """
         Retrieves the schedule of baseball games based on the specified parameters.
@@ -77,6 +89,8 @@ class MLB_Scrape:
         - year_input (list): A list of years to filter the schedule. Default is [2024].
         - sport_id (list): A list of sport IDs to filter the schedule. Default is [1].
         - game_type (list): A list of game types to filter the schedule. Default is ['R'].
+        - start_date (str): The start date (YYYY-MM-DD) of the range. Default is None (start of the season).
+        - end_date (str): The end date (YYYY-MM-DD) of the range. Default is None (end of the season).
         Returns:
         - game_df (pandas.DataFrame): A DataFrame containing the game schedule information, including game ID, date, time, away team, home team, game state, venue ID, and venue name. If the schedule length is 0, it returns a message indicating that different parameters should be selected.
         """
@@ -90,6 +104,13 @@ class MLB_Scrape:
         if not isinstance(game_type, list) or not all(isinstance(gt, str) for gt in game_type):
             raise ValueError("game_type must be a list of strings.")
 
+        # Validate date format
+        date_pattern = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+        if start_date and not date_pattern.match(start_date):
+            raise ValueError(f"start_date {start_date} is not in YYYY-MM-DD format")
+        if end_date and not date_pattern.match(end_date):
+            raise ValueError(f"end_date {end_date} is not in YYYY-MM-DD format")
+
         eastern = timezone('US/Eastern')
 
         # Convert input lists to comma-separated strings
@@ -97,8 +118,15 @@ class MLB_Scrape:
         sport_id_str = ','.join([str(x) for x in sport_id])
         game_type_str = ','.join([str(x) for x in game_type])
 
+        # Restrict the schedule to a date range if requested
+        date_range_str = ''
+        if start_date:
+            date_range_str += f'&startDate={start_date}'
+        if end_date:
+            date_range_str += f'&endDate={end_date}'
+
         # Make API call to retrieve game schedule
-        game_call = requests.get(url=f'https://statsapi.mlb.com/api/v1/schedule/?sportId={sport_id_str}&gameTypes={game_type_str}&season={year_input_str}&hydrate=lineup,players').json()
+        game_call = requests.get(url=f'https://statsapi.mlb.com/api/v1/schedule/?sportId={sport_id_str}&gameTypes={game_type_str}&season={year_input_str}{date_range_str}&hydrate=lineup,players').json()
         try:
             def safe_get(d, keys, default=np.nan):
                 """Safely retrieve nested dictionary values."""
@@ -144,8 +172,9 @@ class MLB_Scrape:
                 game_df['date'].str.to_date(),
                 game_df['time'].str.to_datetime().dt.convert_time_zone(eastern.zone).dt.strftime("%I:%M %p"))
 
-            # Remove duplicate games and sort by date
-            game_df = game_df.unique(subset='game_id').sort('date')
+            # Remove duplicate games and sort by date. Postponed games are listed on both the original
+            # and the makeup date, keep the latest one so the same row is kept on every call.
+            game_df = game_df.sort('date', maintain_order=True).unique(subset='game_id', keep='last', maintain_order=True)
 
             # Check again if the DataFrame is empty after processing
             if len(game_df) == 0:
@@ -181,30 +210,111 @@ class MLB_Scrape:
         
         return data_total
 
-    def get_data(self, game_list_input: list):
+    def get_game_headers(self, game_list_input: list):
+        """
+        Retrieves the date, teams and status of a list of games from the schedule endpoint and caches them.
+
+        Headers of games that are not final are fetched again on every call, so their status stays current.
+        
+        Parameters:
+        - game_list_input (list): A list of game IDs.
+        
+        Returns:
+        - game_headers (dict): The headers keyed by game ID, in the shape of the gameData section of feed/live.
+        """
+        missing_list = [game_id for game_id in game_list_input
+                        if game_id not in self.game_headers or self.game_headers[game_id]['status']['abstractGameState'] != 'Final']
+        
+        # The schedule endpoint accepts many games per call
+        for i in range(0, len(missing_list), 100):
+            game_pk_str = ','.join([str(x) for x in missing_list[i:i + 100]])
+            game_call = requests.get(url=f'https://statsapi.mlb.com/api/v1/schedule?gamePks={game_pk_str}&hydrate=team').json()
+            for game in [y for x in game_call.get('dates', []) for y in x.get('games', [])]:
+                self.game_headers[game['gamePk']] = {
+                    'datetime': {'officialDate': game.get('officialDate')},
+                    'status': {'abstractGameState': game.get('status', {}).get('abstractGameState')},
+                    'teams': {side: {'id': game['teams'][side]['team'].get('id'),
+                                     'abbreviation': game['teams'][side]['team'].get('abbreviation')}
+                              for side in ('away', 'home') if side in game.get('teams', {})},
+                }
+        
+        return {game_id: self.game_headers[game_id] for game_id in game_list_input if game_id in self.game_headers}
+
+    def get_data(self, game_list_input: list, source: str = 'feed', validate: bool = False):
         """
         Retrieves live game data for a list of game IDs in parallel.
         
         Parameters:
         - game_list_input (list): A list of game IDs for which to retrieve live data.
+        - source (str): The endpoint to retrieve the data from. Default is 'feed'.
+            - 'feed': the full v1.1 feed/live document.
+            - 'playByPlay': the much smaller v1 playByPlay document, completed with a cached header of the game date, teams and status.
+        - validate (bool): Also retrieve the games from the other source and report games where get_data_df gives different rows. Default is False.
         
         Returns:
-        - data_total (list): A list of JSON responses containing live game data for each game ID.
+        - data_total (list): A list of JSON responses containing live game data for each game ID. Both sources can be passed to get_data_df.
         """
+        if source not in ['feed', 'playByPlay']:
+            raise ValueError("source must be 'feed' or 'playByPlay'.")
+
         data_total = []
         print('This May Take a While. Progress Bar shows Completion of Data Retrieval.')
+
+        if source == 'playByPlay':
+            self.get_game_headers(game_list_input)
         
         def fetch_data(game_id):
-            r = requests.get(f'https://statsapi.mlb.com/api/v1.1/game/{game_id}/feed/live')
-            return r.json()
+            # Fall back to the full feed for games without a header
+            if source == 'feed' or game_id not in self.game_headers:
+                r = requests.get(f'https://statsapi.mlb.com/api/v1.1/game/{game_id}/feed/live')
+                return r.json()
+            r = requests.get(f'https://statsapi.mlb.com/api/v1/game/{game_id}/playByPlay')
+            return {'gamePk': game_id,
+                    'gameData': self.game_headers[game_id],
+                    'liveData': {'plays': {'allPlays': r.json().get('allPlays', [])}}}
         
         with ThreadPoolExecutor() as executor:
             futures = {executor.submit(fetch_data, game_id): game_id for game_id in game_list_input}
             for future in tqdm(as_completed(futures), total=len(futures), desc="Processing", unit="iteration"):
                 data_total.append(future.result())
+
+        if validate:
+            other_source = 'feed' if source == 'playByPlay' else 'playByPlay'
+            mismatch_list = self.compare_data(data_total, self.get_data(game_list_input, source=other_source))
+            if len(mismatch_list) > 0:
+                print(f'Sources {source} and {other_source} differ for games: {mismatch_list}')
+            else:
+                print(f'Sources {source} and {other_source} match for all games.')
         
         return data_total
 
+    def compare_data(self, data_list: list, other_data_list: list):
+        """
+        Compares the rows that get_data_df produces for two lists of game data JSON objects.
+        
+        Parameters:
+        - data_list (list): A list of JSON objects containing game data.
+        - other_data_list (list): A list of JSON objects containing game data for the same games, e.g. from another source.
+        
+        Returns:
+        - mismatch_list (list): A sorted list of game IDs whose rows differ or that are missing from one of the lists.
+        """
+        def split_games(df):
+            if len(df) == 0:
+                return {}
+            return {key[0] if isinstance(key, tuple) else key: game_df
+                    for key, game_df in df.partition_by('game_id', as_dict=True).items()}
+
+        game_dict = split_games(self.get_data_df(data_list))
+        other_game_dict = split_games(self.get_data_df(other_data_list))
+
+        mismatch_list = []
+        for game_id in set(game_dict) | set(other_game_dict):
+            if game_id not in game_dict or game_id not in other_game_dict or not game_dict[game_id].equals(other_game_dict[game_id]):
+                mismatch_list.append(game_id)
+
+        return sorted(mismatch_list)
+
 
     def get_data_df(self, data_list):
             """
@@ -304,13 +414,66 @@ class MLB_Scrape:
             away_score = []
             home_score = []
 
+            # Runners on base at the start of each at-bat, one row per at-bat
+            ab_game_id = []
+            ab_ab_number = []
+            ab_on_1b = []
+            ab_on_2b = []
+            ab_on_3b = []
+            ab_start_outs = []
+
             for data in data_list:
                 try:
+                    bases = {}
+                    start_outs = 0
+                    last_half_inning = None
                     for ab_id in range(len(data['liveData']['plays']['allPlays'])):
                         ab_list = data['liveData']['plays']['allPlays'][ab_id]
                         
                         # Extract result data once per at-bat
                         ab_result = ab_list.get('result', {})
+
+                        # Bases are empty and there are no outs at the start of every half inning,
+                        # apart from the automatic runner placed on base in extra innings
+                        half_inning = (ab_list['about'].get('inning'), ab_list['about'].get('isTopInning'))
+                        if half_inning != last_half_inning:
+                            bases = {}
+                            start_outs = 0
+                            for play_event in ab_list.get('playEvents', []):
+                                if play_event.get('details', {}).get('eventType') == 'runner_placed' and 'player' in play_event:
+                                    bases['2B'] = play_event['player'].get('id')
+                            for runner in ab_list.get('runners', []):
+                                if runner.get('details', {}).get('eventType') == 'runner_placed' and runner.get('movement', {}).get('end') in ('1B', '2B', '3B'):
+                                    bases = {base: x for base, x in bases.items() if x != runner['details'].get('runner', {}).get('id')}
+                                    bases[runner['movement']['end']] = runner['details'].get('runner', {}).get('id')
+                        last_half_inning = half_inning
+
+                        # The first movement of each runner gives the base it held when the at-bat started.
+                        # Later movements (steals, wild pitches) happen during the at-bat and are ignored.
+                        first_movement = {}
+                        for runner in ab_list.get('runners', []):
+                            runner_id = runner.get('details', {}).get('runner', {}).get('id')
+                            play_index = runner.get('details', {}).get('playIndex', 0)
+                            if runner_id not in first_movement or play_index < first_movement[runner_id][0]:
+                                first_movement[runner_id] = (play_index, runner.get('movement', {}).get('originBase'))
+
+                        # Runners that move during the at-bat start from their origin base, replacing what the previous play left there
+                        for runner_id, (play_index, origin_base) in first_movement.items():
+                            if origin_base in ('1B', '2B', '3B'):
+                                bases = {base: x for base, x in bases.items() if x != runner_id}
+                                bases[origin_base] = runner_id
+
+                        ab_game_id.append(data['gamePk'])
+                        ab_ab_number.append(ab_list.get('atBatIndex'))
+                        ab_on_1b.append(bases.get('1B'))
+                        ab_on_2b.append(bases.get('2B'))
+                        ab_on_3b.append(bases.get('3B'))
+                        ab_start_outs.append(start_outs)
+
+                        # Runners left on base and outs after the play become the starting state of the next at-bat
+                        matchup = ab_list.get('matchup', {})
+                        bases = {base: matchup[key]['id'] for base, key in (('1B', 'postOnFirst'), ('2B', 'postOnSecond'), ('3B', 'postOnThird')) if key in matchup}
+                        start_outs = ab_list.get('count', {}).get('outs', start_outs)
                         
                         for n in range(len(ab_list['playEvents'])):
                             
@@ -592,18 +755,59 @@ class MLB_Scrape:
                 },strict=False
             )
 
+            # Broadcast the runners of each at-bat to its pitches. The join also runs on an empty
+            # frame so the output columns do not depend on whether any pitch was found
+            ab_df = pl.DataFrame(data={
+                'game_id':ab_game_id,
+                'ab_number':ab_ab_number,
+                'on_1b':ab_on_1b,
+                'on_2b':ab_on_2b,
+                'on_3b':ab_on_3b,
+                'ab_start_outs':ab_start_outs,
+                },schema={'game_id':pl.Int64,'ab_number':pl.Int64,'on_1b':pl.Int64,'on_2b':pl.Int64,'on_3b':pl.Int64,'ab_start_outs':pl.Int64}
+            ).unique(subset=['game_id','ab_number'],keep='first')
+
+            df = (df.with_row_index('row_index')
+                  .with_columns(pl.col('game_id').cast(pl.Int64),pl.col('ab_number').cast(pl.Int64))
+                  .join(ab_df,on=['game_id','ab_number'],how='left')
+                  .sort('row_index')
+                  .drop('row_index'))
+
+            # Base-out state from 0 to 23 at the start of the at-bat: outs * 8 + base state
+            df = df.with_columns(
+                (pl.col('on_1b').is_not_null().cast(pl.Int64)
+                + pl.col('on_2b').is_not_null().cast(pl.Int64) * 2
+                + pl.col('on_3b').is_not_null().cast(pl.Int64) * 4).alias('base_state'))
+            df = df.with_columns(
+                pl.when(pl.col('ab_start_outs').is_between(0, 2))
+                .then(pl.col('ab_start_outs') * 8 + pl.col('base_state'))
+                .otherwise(None)
+                .alias('base_out_state'))
+
+            # Look up the run expectancy of every base-out state
+            df = df.with_columns(
+                pl.col('base_out_state')
+                .replace_strict(list(range(24)),[x for outs_row in RE24 for x in outs_row],default=None,return_dtype=pl.Float64)
+                .alias('run_expectancy'))
+
             return df
 
     
-    def get_teams(self):
+    def get_teams(self, season: int = None):
         """
         Retrieves information about MLB teams from the MLB API and processes it into a Polars DataFrame.
         
+        Parameters:
+        - season (int): The season year for which to retrieve the teams. Default is the current season.
+
         Returns:
         - mlb_teams_df (pl.DataFrame): A DataFrame containing team information, including team ID, city, name, franchise, abbreviation, parent organization ID, parent organization name, league ID, and league name.
         """
         # Make API call to retrieve team information
-        teams = requests.get(url='https://statsapi.mlb.com/api/v1/teams/').json()
+        if season is not None:
+            teams = requests.get(url=f'https://statsapi.mlb.com/api/v1/teams/?season={season}').json()
+        else:
+            teams = requests.get(url='https://statsapi.mlb.com/api/v1/teams/').json()
 
         # Extract relevant data from the API response
         mlb_teams_city = [x['franchiseName'] if 'franchiseName' in x else None for x in teams['teams']]
@@ -746,14 +950,22 @@ class MLB_Scrape:
         - game_type (list): A list of game types to filter the players. Default is ['R'].
 
         Returns:
-        - player_df (pl.DataFrame): A DataFrame containing player information, including player ID, name, position, team, and age.
+        - player_df (pl.DataFrame): A DataFrame containing player information, including player ID, name, position, team, age, and handedness.
         """
         game_type_str = ','.join([str(x) for x in game_type])
 
         # If game type is 'S', fetch data from a different endpoint
         if game_type_str == 'S':
-            # Fetch pitcher data
-            pitcher_data = requests.get(f'https://bdfed.stitch.mlbinfra.com/bdfed/stats/player?&env=prod&season={season}&sportId=1&stats=season&group=pitching&gameType=S&limit=1000000&offset=0&sortStat=inningsPitched&order=asc').json()
+            # Fetch pitcher and batter data concurrently
+            pitcher_url = f'https://bdfed.stitch.mlbinfra.com/bdfed/stats/player?&env=prod&season={season}&sportId=1&stats=season&group=pitching&gameType=S&limit=1000000&offset=0&sortStat=inningsPitched&order=asc'
+            batter_url = f'https://bdfed.stitch.mlbinfra.com/bdfed/stats/player?&env=prod&season={season}&sportId=1&stats=season&group=hitting&gameType=S&limit=1000000&offset=0'
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                pitcher_future = executor.submit(lambda: requests.get(pitcher_url).json())
+                batter_future = executor.submit(lambda: requests.get(batter_url).json())
+                pitcher_data = pitcher_future.result()
+                batter_data = batter_future.result()
+
+            # Process pitcher data
             fullName_list = [x['playerFullName'] for x in pitcher_data['stats']]
             firstName_list = [x['playerFirstName'] for x in pitcher_data['stats']]
             useName_list = [x['playerUseName'] for x in pitcher_data['stats']]
@@ -772,8 +984,7 @@ class MLB_Scrape:
                 'team': team_list
             })
             
-            # Fetch batter data
-            batter_data = requests.get(f'https://bdfed.stitch.mlbinfra.com/bdfed/stats/player?&env=prod&season={season}&sportId=1&stats=season&group=hitting&gameType=S&limit=1000000&offset=0').json()
+            # Process batter data
             fullName_list = [x['playerFullName'] for x in batter_data['stats']]
             firstName_list = [x['playerFirstName'] for x in batter_data['stats']]
             useName_list = [x['playerUseName'] for x in batter_data['stats']]
@@ -811,6 +1022,8 @@ class MLB_Scrape:
             height_list = [x['height'] if 'height' in x else None for x in player_data]
             age_list = [x['currentAge'] if 'currentAge' in x else None for x in player_data]
             birthDate_list = [x['birthDate'] if 'birthDate' in x else None for x in player_data]
+            bat_side_list = [x['batSide']['code'] if 'batSide' in x else None for x in player_data]
+            pitch_hand_list = [x['pitchHand']['code'] if 'pitchHand' in x else None for x in player_data]
     
             df = pl.DataFrame(data={
                 'player_id': id_list,
@@ -823,7 +1036,9 @@ class MLB_Scrape:
                 'weight': weight_list,
                 'height': height_list,
                 'age': age_list,
-                'birthDate': birthDate_list
+                'birthDate': birthDate_list,
+                'bat_side': bat_side_list,
+                'pitch_hand': pitch_hand_list
             })
                 
         return df
@@ -0,0 +1,156 @@
+import os
+import shutil
+import hashlib
+import inspect
+import tempfile
+import polars as pl
+from api_scraper import MLB_Scrape, PARSER_VERSION
+
+
+def parser_fingerprint():
+    """
+    Returns a short fingerprint of the get_data_df parser.
+
+    The fingerprint combines PARSER_VERSION with the source code of get_data_df,
+    so cached frames are invalidated as soon as the parser is edited.
+
+    Returns:
+    - fingerprint (str): A 12 character hexadecimal fingerprint.
+    """
+    source = inspect.getsource(MLB_Scrape.get_data_df)
+    return hashlib.sha1(f'{PARSER_VERSION}\n{source}'.encode('utf-8')).hexdigest()[:12]
+
+
+class Frame_Cache:
+
+    def __init__(self, cache_dir: str = 'cache/frames', scraper: MLB_Scrape = None, source: str = 'feed'):
+        """
+        Cache of parsed per-game frames stored as uncompressed Arrow IPC (Feather v2) files.
+
+        Files are memory-mapped when read, so reloading a season does not parse any JSON
+        and concatenating games does not copy any data. Several processes on the same
+        host share the files through the page cache.
+
+        Parameters:
+        - cache_dir (str): The directory where the frames are stored. Default is 'cache/frames'.
+        - scraper (MLB_Scrape): The scraper used to fetch and parse missing games. A new one is created if not provided.
+        - source (str): The endpoint used to fetch missing games, 'feed' or 'playByPlay'. See MLB_Scrape.get_data. Default is 'feed'.
+        """
+        self.cache_dir = cache_dir
+        self.source = source
+        self.scraper = scraper if scraper is not None else MLB_Scrape()
+        self.fingerprint = parser_fingerprint()
+        self.version_dir = os.path.join(self.cache_dir, self.fingerprint)
+
+    def path(self, game_id: int):
+        """Returns the file used to store a game for the current parser."""
+        return os.path.join(self.version_dir, f'{game_id}.arrow')
+
+    def has(self, game_id: int):
+        """
+        Checks if a game is cached for the current parser.
+
+        Parameters:
+        - game_id (int): The ID of the game.
+
+        Returns:
+        - bool: True if the game is cached, False otherwise.
+        """
+        return os.path.exists(self.path(game_id))
+
+    def put(self, game_id: int, df: pl.DataFrame):
+        """
+        Stores the parsed frame of a game.
+
+        The file is written under a temporary name and moved into place, so readers in
+        other processes never see a partially written file.
+
+        Parameters:
+        - game_id (int): The ID of the game.
+        - df (pl.DataFrame): The parsed frame of the game, as returned by get_data_df.
+        """
+        os.makedirs(self.version_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.version_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            # Compressed IPC files can not be memory-mapped
+            df.write_ipc(tmp_path, compression='uncompressed')
+            os.replace(tmp_path, self.path(game_id))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get(self, game_id: int):
+        """
+        Loads the cached frame of a game by memory-mapping its file.
+
+        Parameters:
+        - game_id (int): The ID of the game.
+
+        Returns:
+        - df (pl.DataFrame): The parsed frame of the game, or None if the game is not cached.
+        """
+        if not self.has(game_id):
+            return None
+        return pl.read_ipc(self.path(game_id), memory_map=True)
+
+    def get_data_df(self, game_list_input: list, fetch: bool = True):
+        """
+        Returns the parsed frame for a list of games, fetching and parsing only the games that are not cached.
+
+        Only final games are cached. Games that are still in progress are returned but not
+        written, so later calls fetch them again instead of serving a partial game.
+
+        Parameters:
+        - game_list_input (list): A list of game IDs.
+        - fetch (bool): Fetch and cache the missing games. If False, missing games are skipped. Default is True.
+
+        Returns:
+        - data_df (pl.DataFrame): The concatenated frames in the order of game_list_input, with the same columns as get_data_df.
+        """
+        missing_list = [game_id for game_id in game_list_input if not self.has(game_id)]
+        live_frames = {}
+
+        if fetch and len(missing_list) > 0:
+            data_list = self.scraper.get_data(game_list_input=missing_list, source=self.source)
+            data_df = self.scraper.get_data_df(data_list=data_list)
+
+            # Both sources carry the game status in gameData
+            final_list = [data.get('gamePk') for data in data_list
+                          if data.get('gameData', {}).get('status', {}).get('abstractGameState') == 'Final']
+
+            # Games without any pitches produce no rows and are not cached
+            if len(data_df) > 0:
+                for key, game_df in data_df.partition_by('game_id', as_dict=True).items():
+                    game_id = key[0] if isinstance(key, tuple) else key
+                    if game_id in final_list:
+                        self.put(game_id, game_df)
+                    else:
+                        live_frames[game_id] = game_df
+
+        frame_list = [live_frames[game_id] if game_id in live_frames else self.get(game_id) for game_id in game_list_input]
+        frame_list = [df for df in frame_list if df is not None]
+
+        if len(frame_list) == 0:
+            return pl.DataFrame()
+
+        # Games can infer different types for columns that are entirely null, such as is_review
+        return pl.concat(frame_list, how='vertical_relaxed', rechunk=False)
+
+    def prune(self):
+        """
+        Deletes the frames written by other parser versions.
+
+        Returns:
+        - removed (list): The fingerprints of the deleted parser versions.
+        """
+        removed = []
+        if not os.path.isdir(self.cache_dir):
+            return removed
+
+        for name in os.listdir(self.cache_dir):
+            if name != self.fingerprint and os.path.isdir(os.path.join(self.cache_dir, name)):
+                shutil.rmtree(os.path.join(self.cache_dir, name))
+                removed.append(name)
+
+        return removed
@@ -0,0 +1,410 @@
+import numpy as np
+import polars as pl
+
+# Tracking columns from get_data_df used to compare pitches
+FEATURES = ['start_speed', 'ivb', 'hb', 'spin_rate', 'extension', 'x0', 'z0']
+
+
+class KD_Tree:
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 64):
+        """
+        Static k-d tree over a float32 point matrix for exact k-nearest-neighbor queries.
+
+        Points are reordered so every node covers a contiguous slice, and each node keeps
+        its bounding box so whole subtrees are skipped when they can not hold a closer point.
+
+        Parameters:
+        - points (np.ndarray): An (n, d) matrix of points.
+        - leaf_size (int): The maximum number of points in a leaf. Default is 64.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float32)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(points))
+
+        self.start = []
+        self.end = []
+        self.left = []
+        self.right = []
+        self.split_dim = []
+        self.split_val = []
+
+        if len(points) > 0:
+            stack = [(self._add_node(0, len(points)), 0, len(points))]
+            while stack:
+                node, start, end = stack.pop()
+                if end - start <= leaf_size:
+                    continue
+
+                # Split on the widest dimension at the median
+                node_points = points[self.order[start:end]]
+                dim = int(np.argmax(node_points.max(axis=0) - node_points.min(axis=0)))
+                mid = (end - start) // 2
+                part = np.argpartition(node_points[:, dim], mid)
+                self.order[start:end] = self.order[start:end][part]
+
+                self.split_dim[node] = dim
+                self.split_val[node] = float(points[self.order[start + mid], dim])
+                self.left[node] = self._add_node(start, start + mid)
+                self.right[node] = self._add_node(start + mid, end)
+                stack.append((self.left[node], start, start + mid))
+                stack.append((self.right[node], start + mid, end))
+
+        self.points = np.ascontiguousarray(points[self.order])
+        self.lo = np.array([self.points[s:e].min(axis=0) for s, e in zip(self.start, self.end)], dtype=np.float32)
+        self.hi = np.array([self.points[s:e].max(axis=0) for s, e in zip(self.start, self.end)], dtype=np.float32)
+
+    def _add_node(self, start: int, end: int):
+        """Adds a leaf node covering a slice of the ordered points and returns its index."""
+        self.start.append(start)
+        self.end.append(end)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.split_dim.append(-1)
+        self.split_val.append(0.0)
+        return len(self.start) - 1
+
+    def query(self, point: np.ndarray, k: int = 10):
+        """
+        Finds the k points closest to a point.
+
+        Parameters:
+        - point (np.ndarray): A (d,) point.
+        - k (int): The number of neighbors to return. Default is 10.
+
+        Returns:
+        - distances (np.ndarray): The Euclidean distances, closest first.
+        - indices (np.ndarray): The row indices of the neighbors in the original point matrix.
+        """
+        k = min(k, len(self.points))
+        if k == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        point = np.asarray(point, dtype=np.float32)
+        best_dist = np.full(k, np.inf, dtype=np.float32)
+        best_index = np.full(k, -1, dtype=np.int64)
+
+        stack = [0]
+        while stack:
+            node = stack.pop()
+
+            # Skip the node if its bounding box is farther than the current k-th neighbor
+            gap = np.maximum(self.lo[node] - point, 0) + np.maximum(point - self.hi[node], 0)
+            if gap @ gap > best_dist.max():
+                continue
+
+            if self.left[node] == -1:
+                start, end = self.start[node], self.end[node]
+                diff = self.points[start:end] - point
+                dist = np.einsum('ij,ij->i', diff, diff)
+                all_dist = np.concatenate([best_dist, dist])
+                all_index = np.concatenate([best_index, np.arange(start, end)])
+                keep = np.argpartition(all_dist, k - 1)[:k]
+                best_dist, best_index = all_dist[keep], all_index[keep]
+            elif point[self.split_dim[node]] < self.split_val[node]:
+                # Visit the nearer child first
+                stack.extend([self.right[node], self.left[node]])
+            else:
+                stack.extend([self.left[node], self.right[node]])
+
+        found = best_index >= 0
+        sort = np.argsort(best_dist[found])
+        return np.sqrt(best_dist[found][sort]), self.order[best_index[found][sort]]
+
+
+class Pitch_Similarity_Index:
+
+    def __init__(self, features: list = FEATURES, leaf_size: int = 64, rebuild_fraction: float = 0.2, min_pitches: int = 25):
+        """
+        Nearest-neighbor index of pitches and pitcher arsenals over tracking columns.
+
+        Every pitch type gets its own standardized float32 feature matrix and k-d tree. Pitches
+        added after the tree was built are kept in a small buffer that is searched directly,
+        and the tree is rebuilt once the buffer grows past rebuild_fraction of the tree. The
+        standardization of a pitch type is recomputed over all of its pitches at every rebuild.
+
+        Parameters:
+        - features (list): The get_data_df columns to compare. Default is FEATURES.
+        - leaf_size (int): The maximum number of points in a tree leaf. Default is 64.
+        - rebuild_fraction (float): The buffer size, relative to the tree, that triggers a rebuild. Default is 0.2.
+        - min_pitches (int): The minimum number of pitches of a type for a pitcher to be in the arsenal index. Default is 25.
+        """
+        self.features = list(features)
+        self.leaf_size = leaf_size
+        self.rebuild_fraction = rebuild_fraction
+        self.min_pitches = min_pitches
+        self._reset()
+
+    def _reset(self):
+        """Removes every pitch from the index."""
+        # Per pitch type: running feature sums and sums of squares, for the standardization
+        self.value_sum = {}
+        self.value_sq_sum = {}
+
+        # Per pitch type: standardization, raw and standardized points, identifiers and the tree
+        self.mean = {}
+        self.std = {}
+        self.values = {}
+        self.points = {}
+        self.play_id = {}
+        self.pitcher_id = {}
+        self.game_id = {}
+        self.tree = {}
+        self.tree_size = {}
+
+        # Per pitch type: running feature sums and counts per pitcher, for the arsenal index
+        self.arsenal_sum = {}
+        self.arsenal_count = {}
+        self.arsenal_tree = {}
+
+    def _clean(self, df: pl.DataFrame):
+        """Keeps the pitches with a pitch type and every feature present."""
+        return df.select(['play_id', 'pitcher_id', 'game_id', 'pitch_type'] + self.features).drop_nulls(subset=['pitcher_id', 'pitch_type'] + self.features)
+
+    def _standardize(self, pitch_type: str, values: np.ndarray):
+        """Standardizes raw feature values with the statistics of a pitch type."""
+        return np.ascontiguousarray((values - self.mean[pitch_type]) / self.std[pitch_type], dtype=np.float32)
+
+    def _build(self, pitch_type: str):
+        """Recomputes the standardization of a pitch type from its running sums and rebuilds its tree over all of its points."""
+        count = len(self.values[pitch_type])
+        mean = self.value_sum[pitch_type] / count
+        std = np.sqrt(np.maximum(self.value_sq_sum[pitch_type] / count - mean ** 2, 0))
+        self.mean[pitch_type] = mean.astype(np.float32)
+        self.std[pitch_type] = np.where(std > 0, std, 1).astype(np.float32)
+
+        self.points[pitch_type] = self._standardize(pitch_type, self.values[pitch_type])
+        self.tree[pitch_type] = KD_Tree(self.points[pitch_type], leaf_size=self.leaf_size)
+        self.tree_size[pitch_type] = count
+
+        # The arsenal tree uses the previous standardization
+        self.arsenal_tree.pop(pitch_type, None)
+
+    def fit(self, df: pl.DataFrame):
+        """
+        Builds the index from scratch.
+
+        Parameters:
+        - df (pl.DataFrame): A DataFrame of pitches, such as the output of get_data_df.
+        """
+        self._reset()
+        self.add(df)
+
+    def add(self, df: pl.DataFrame):
+        """
+        Adds pitches to the index, e.g. from newly ingested games.
+
+        The standardization of a pitch type is recomputed from every pitch added so far each time its tree is rebuilt.
+
+        Parameters:
+        - df (pl.DataFrame): A DataFrame of pitches, such as the output of get_data_df.
+        """
+        df = self._clean(df)
+        if len(df) == 0:
+            return
+
+        for key, type_df in df.partition_by('pitch_type', as_dict=True).items():
+            pitch_type = key[0] if isinstance(key, tuple) else key
+            values = type_df.select(self.features).to_numpy().astype(np.float32)
+
+            if pitch_type not in self.values:
+                self.value_sum[pitch_type] = np.zeros(len(self.features), dtype=np.float64)
+                self.value_sq_sum[pitch_type] = np.zeros(len(self.features), dtype=np.float64)
+                self.values[pitch_type] = np.empty((0, len(self.features)), dtype=np.float32)
+                self.play_id[pitch_type] = np.empty(0, dtype=str)
+                self.pitcher_id[pitch_type] = np.empty(0, dtype=np.int64)
+                self.game_id[pitch_type] = np.empty(0, dtype=np.int64)
+                self.tree_size[pitch_type] = 0
+                self.arsenal_sum[pitch_type] = {}
+                self.arsenal_count[pitch_type] = {}
+
+            self.value_sum[pitch_type] += values.sum(axis=0, dtype=np.float64)
+            self.value_sq_sum[pitch_type] += np.square(values, dtype=np.float64).sum(axis=0)
+            self.values[pitch_type] = np.concatenate([self.values[pitch_type], values])
+            self.play_id[pitch_type] = np.concatenate([self.play_id[pitch_type], type_df['play_id'].fill_null('').to_numpy().astype(str)])
+            pitcher_ids = type_df['pitcher_id'].to_numpy().astype(np.int64)
+            self.pitcher_id[pitch_type] = np.concatenate([self.pitcher_id[pitch_type], pitcher_ids])
+            self.game_id[pitch_type] = np.concatenate([self.game_id[pitch_type], type_df['game_id'].to_numpy().astype(np.int64)])
+
+            # Update the running arsenal sums with one group-by per pitch type
+            sum_df = type_df.group_by('pitcher_id').agg([pl.len().alias('count')] + [pl.col(x).sum() for x in self.features])
+            for row in sum_df.iter_rows():
+                pitcher_id, count, sums = row[0], row[1], np.array(row[2:], dtype=np.float64)
+                self.arsenal_sum[pitch_type][pitcher_id] = self.arsenal_sum[pitch_type].get(pitcher_id, 0) + sums
+                self.arsenal_count[pitch_type][pitcher_id] = self.arsenal_count[pitch_type].get(pitcher_id, 0) + count
+            self.arsenal_tree.pop(pitch_type, None)
+
+            pending = len(self.values[pitch_type]) - self.tree_size[pitch_type]
+            if pitch_type not in self.tree or pending > self.rebuild_fraction * self.tree_size[pitch_type]:
+                self._build(pitch_type)
+            else:
+                # Buffered pitches use the standardization of the current tree until the next rebuild
+                self.points[pitch_type] = np.concatenate([self.points[pitch_type], self._standardize(pitch_type, values)])
+
+    def _search(self, pitch_type: str, point: np.ndarray, k: int):
+        """Searches the tree and the buffer of pitches added after it was built."""
+        dist, index = self.tree[pitch_type].query(point, k=k)
+
+        tree_size = self.tree_size[pitch_type]
+        if len(self.points[pitch_type]) > tree_size:
+            diff = self.points[pitch_type][tree_size:] - point
+            dist = np.concatenate([dist, np.sqrt(np.einsum('ij,ij->i', diff, diff))])
+            index = np.concatenate([index, np.arange(tree_size, len(self.points[pitch_type]))])
+            sort = np.argsort(dist)[:k]
+            dist, index = dist[sort], index[sort]
+
+        return dist, index
+
+    def query_pitches(self, df: pl.DataFrame, k: int = 10):
+        """
+        Finds the k most similar pitches of the same pitch type for every pitch in a DataFrame.
+
+        A queried pitch that is itself in the index, matched by play_id, is not returned as its own neighbor.
+
+        Parameters:
+        - df (pl.DataFrame): The pitches to look up, with pitch_type, the feature columns and optionally play_id.
+        - k (int): The number of neighbors per pitch. Default is 10.
+
+        Returns:
+        - neighbor_df (pl.DataFrame): One row per neighbor with the query row number, rank, play_id, pitcher_id, game_id, pitch_type and distance in standard deviations.
+        """
+        query_index = []
+        rank = []
+        play_id = []
+        pitcher_id = []
+        game_id = []
+        pitch_type = []
+        distance = []
+
+        query_play_id = df['play_id'].to_list() if 'play_id' in df.columns else [None] * len(df)
+
+        for i, row in enumerate(df.select(['pitch_type'] + self.features).iter_rows()):
+            if row[0] not in self.tree or any(x is None for x in row[1:]):
+                continue
+            point = self._standardize(row[0], np.array(row[1:], dtype=np.float32))
+
+            # Drop the pitch itself, as similar_pitchers drops the pitcher itself. The search is
+            # widened if the pitch was added more than once
+            search_k = k + 1
+            while True:
+                dist, index = self._search(row[0], point, search_k)
+                if query_play_id[i]:
+                    keep = self.play_id[row[0]][index] != query_play_id[i]
+                    dist, index = dist[keep], index[keep]
+                if len(index) >= k or search_k >= len(self.points[row[0]]):
+                    break
+                search_k *= 2
+            dist, index = dist[:k], index[:k]
+
+            query_index.extend([i] * len(index))
+            rank.extend(range(1, len(index) + 1))
+            play_id.extend(self.play_id[row[0]][index].tolist())
+            pitcher_id.extend(self.pitcher_id[row[0]][index].tolist())
+            game_id.extend(self.game_id[row[0]][index].tolist())
+            pitch_type.extend([row[0]] * len(index))
+            distance.extend(dist.tolist())
+
+        return pl.DataFrame(data={'query_index': query_index,
+                                  'rank': rank,
+                                  'play_id': play_id,
+                                  'pitcher_id': pitcher_id,
+                                  'game_id': game_id,
+                                  'pitch_type': pitch_type,
+                                  'distance': distance},
+                            schema={'query_index': pl.Int64, 'rank': pl.Int64, 'play_id': pl.String, 'pitcher_id': pl.Int64,
+                                    'game_id': pl.Int64, 'pitch_type': pl.String, 'distance': pl.Float64})
+
+    def _arsenal(self, pitch_type: str):
+        """Returns the pitcher IDs, pitch counts, standardized mean features and tree of a pitch type."""
+        if pitch_type not in self.arsenal_tree:
+            counts = self.arsenal_count[pitch_type]
+            pitcher_ids = np.array([x for x in counts if counts[x] >= self.min_pitches], dtype=np.int64)
+            mean_values = np.array([self.arsenal_sum[pitch_type][x] / counts[x] for x in pitcher_ids]).reshape(-1, len(self.features))
+            points = self._standardize(pitch_type, mean_values)
+            pitch_counts = np.array([counts[x] for x in pitcher_ids], dtype=np.int64)
+            self.arsenal_tree[pitch_type] = (pitcher_ids, pitch_counts, points, KD_Tree(points, leaf_size=self.leaf_size))
+        return self.arsenal_tree[pitch_type]
+
+    def similar_pitchers(self, pitcher_id: int, pitch_type: str, k: int = 10):
+        """
+        Finds the pitchers whose average pitch of a type is closest to a pitcher's.
+
+        Parameters:
+        - pitcher_id (int): The ID of the pitcher.
+        - pitch_type (str): The pitch type code, e.g. 'SL'.
+        - k (int): The number of pitchers to return. Default is 10.
+
+        Returns:
+        - pitcher_df (pl.DataFrame): The pitcher_id, number of pitches and distance in standard deviations of the closest pitchers, closest first.
+        """
+        if pitch_type not in self.arsenal_count or pitcher_id not in self.arsenal_count[pitch_type]:
+            print(f'No {pitch_type} pitches found for pitcher {pitcher_id}')
+            return None
+
+        pitcher_ids, pitch_counts, points, tree = self._arsenal(pitch_type)
+        mean_values = self.arsenal_sum[pitch_type][pitcher_id] / self.arsenal_count[pitch_type][pitcher_id]
+        dist, index = tree.query(self._standardize(pitch_type, mean_values), k=k + 1)
+
+        # Drop the pitcher itself
+        keep = pitcher_ids[index] != pitcher_id
+        dist, index = dist[keep][:k], index[keep][:k]
+
+        return pl.DataFrame(data={'pitcher_id': pitcher_ids[index],
+                                  'pitch_type': [pitch_type] * len(index),
+                                  'pitches': pitch_counts[index],
+                                  'distance': dist.astype(np.float64)})
+
+    def save(self, path: str):
+        """
+        Saves the index to a NumPy .npz file. The standardization and trees are rebuilt when the index is loaded.
+
+        Pitches still in the buffer are folded into the rebuilt tree and standardization, so a loaded
+        index can return slightly different distances than the saved one if it had pitches pending a rebuild.
+
+        Parameters:
+        - path (str): The file to write.
+        """
+        arrays = {'features': np.array(self.features),
+                  'settings': np.array([self.leaf_size, self.rebuild_fraction, self.min_pitches], dtype=np.float64),
+                  'pitch_types': np.array(list(self.values), dtype=str)}
+        for i, pitch_type in enumerate(self.values):
+            arrays[f'{i}_values'] = self.values[pitch_type]
+            arrays[f'{i}_play_id'] = self.play_id[pitch_type]
+            arrays[f'{i}_pitcher_id'] = self.pitcher_id[pitch_type]
+            arrays[f'{i}_game_id'] = self.game_id[pitch_type]
+            arrays[f'{i}_arsenal_id'] = np.array(list(self.arsenal_count[pitch_type]), dtype=np.int64)
+            arrays[f'{i}_arsenal_count'] = np.array(list(self.arsenal_count[pitch_type].values()), dtype=np.int64)
+            arrays[f'{i}_arsenal_sum'] = np.array(list(self.arsenal_sum[pitch_type].values()), dtype=np.float64).reshape(-1, len(self.features))
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Loads an index saved with save.
+
+        Every tree is rebuilt and every standardization recomputed over all of the saved pitches,
+        so distances can differ from the saved index if it had pitches pending a rebuild.
+
+        Parameters:
+        - path (str): The file to read.
+
+        Returns:
+        - index (Pitch_Similarity_Index): The loaded index.
+        """
+        arrays = np.load(path)
+        leaf_size, rebuild_fraction, min_pitches = arrays['settings']
+        index = cls(features=arrays['features'].tolist(), leaf_size=int(leaf_size),
+                    rebuild_fraction=float(rebuild_fraction), min_pitches=int(min_pitches))
+
+        for i, pitch_type in enumerate(arrays['pitch_types'].tolist()):
+            index.values[pitch_type] = np.ascontiguousarray(arrays[f'{i}_values'])
+            index.value_sum[pitch_type] = index.values[pitch_type].sum(axis=0, dtype=np.float64)
+            index.value_sq_sum[pitch_type] = np.square(index.values[pitch_type], dtype=np.float64).sum(axis=0)
+            index.play_id[pitch_type] = arrays[f'{i}_play_id']
+            index.pitcher_id[pitch_type] = arrays[f'{i}_pitcher_id']
+            index.game_id[pitch_type] = arrays[f'{i}_game_id']
+            index.arsenal_count[pitch_type] = dict(zip(arrays[f'{i}_arsenal_id'].tolist(), arrays[f'{i}_arsenal_count'].tolist()))
+            index.arsenal_sum[pitch_type] = dict(zip(arrays[f'{i}_arsenal_id'].tolist(), arrays[f'{i}_arsenal_sum']))
+            index._build(pitch_type)
+
+        return index
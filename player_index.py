@@ -0,0 +1,274 @@
+import os
+import re
+import difflib
+import unicodedata
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+import polars as pl
+from api_scraper import MLB_Scrape
+
+
+def normalize_name(name: str):
+    """
+    Normalizes a player or team name for searching.
+
+    Accents are stripped, case is folded and punctuation is removed, so that
+    'Ronald Acuña Jr.' and 'ronald acuna jr' map to the same key.
+
+    Parameters:
+    - name (str): The name to normalize.
+
+    Returns:
+    - key (str): The normalized name. Returns an empty string for missing names.
+    """
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r'[^a-z0-9 ]', '', name.lower())
+    return ' '.join(name.split())
+
+
+class MLB_Index:
+
+    def __init__(self,
+                 season: int,
+                 sport_id: int = 1,
+                 game_type: list = ['R'],
+                 cache_dir: str = 'cache/index',
+                 scraper: MLB_Scrape = None):
+        """
+        Indexed lookup service for players and teams of a single season.
+
+        The players and teams are loaded once (from disk when available, otherwise
+        from get_players and get_teams in parallel) and kept as dictionaries keyed by
+        ID, together with a sorted name index for prefix and fuzzy search.
+
+        Parameters:
+        - season (int): The season year to index.
+        - sport_id (int): The ID of the sport for which to retrieve player data. Default is 1.
+        - game_type (list): A list of game types to filter the players. Default is ['R'].
+        - cache_dir (str): The directory where the player and team tables are persisted. Default is 'cache/index'.
+        - scraper (MLB_Scrape): The scraper used to fetch the data. A new one is created if not provided.
+        """
+        if not isinstance(game_type, list) or not all(isinstance(gt, str) for gt in game_type):
+            raise ValueError("game_type must be a list of strings.")
+
+        self.season = season
+        self.sport_id = sport_id
+        self.game_type = game_type
+        self.cache_dir = cache_dir
+        self.scraper = scraper if scraper is not None else MLB_Scrape()
+
+        self.player_df = None
+        self.team_df = None
+        self.players = {}
+        self.teams = {}
+        self._name_keys = []
+        self._name_ids = []
+        self._fuzzy_keys = []
+        self._fuzzy_ids = {}
+
+        self.load()
+
+    def _cache_path(self, table: str):
+        """Returns the file used to persist a table for this season."""
+        game_type_str = '_'.join(self.game_type)
+        return os.path.join(self.cache_dir, f'{table}_{self.season}_{self.sport_id}_{game_type_str}.parquet')
+
+    def load(self, refresh: bool = False):
+        """
+        Loads the player and team tables and builds the lookup indexes.
+
+        Parameters:
+        - refresh (bool): Ignore the persisted tables and fetch them from the API again. Default is False.
+        """
+        player_path = self._cache_path('players')
+        team_path = self._cache_path('teams')
+
+        if not refresh and os.path.exists(player_path) and os.path.exists(team_path):
+            self.player_df = pl.read_parquet(player_path)
+            self.team_df = pl.read_parquet(team_path)
+        else:
+            # Fetch both endpoints at the same time
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                player_future = executor.submit(self.scraper.get_players,
+                                                sport_id=self.sport_id,
+                                                season=self.season,
+                                                game_type=self.game_type)
+                team_future = executor.submit(self.scraper.get_teams, season=self.season)
+                self.player_df = player_future.result()
+                self.team_df = team_future.result()
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.player_df.write_parquet(player_path)
+            self.team_df.write_parquet(team_path)
+
+        self._build()
+
+    def _build(self):
+        """Builds the ID dictionaries, the sorted name index and the fuzzy search keys."""
+        self.players = {row['player_id']: row for row in self.player_df.iter_rows(named=True)}
+        self.teams = {row['team_id']: row for row in self.team_df.iter_rows(named=True)}
+
+        # Index every player under the full name, the use name and the last name,
+        # so prefix searches match 'shohei', 'ohtani' or 'shohei oht'
+        entries = set()
+        for player_id, row in self.players.items():
+            use_name = f"{row.get('use_name') or ''} {row.get('last_name') or ''}"
+            for name in (row.get('name'), use_name, row.get('last_name')):
+                key = normalize_name(name)
+                if key:
+                    entries.add((key, player_id))
+
+        entries = sorted(entries)
+        self._name_keys = [x[0] for x in entries]
+        self._name_ids = [x[1] for x in entries]
+
+        # Distinct keys for fuzzy matching, each mapped to its player IDs in name order
+        self._fuzzy_ids = {}
+        for key, player_id in entries:
+            self._fuzzy_ids.setdefault(key, []).append(player_id)
+        self._fuzzy_keys = list(self._fuzzy_ids)
+
+    def get_player(self, player_id: int):
+        """
+        Looks up a player by ID.
+
+        Parameters:
+        - player_id (int): The ID of the player.
+
+        Returns:
+        - player (dict): The player row, or None if the player is not in the index.
+        """
+        return self.players.get(player_id)
+
+    def get_team(self, team_id: int):
+        """
+        Looks up a team by ID.
+
+        Parameters:
+        - team_id (int): The ID of the team.
+
+        Returns:
+        - team (dict): The team row, or None if the team is not in the index.
+        """
+        return self.teams.get(team_id)
+
+    def search_prefix(self, prefix: str, limit: int = 10):
+        """
+        Finds players whose full, use or last name starts with a prefix.
+
+        Parameters:
+        - prefix (str): The start of the name to search for.
+        - limit (int): The maximum number of players to return. Default is 10.
+
+        Returns:
+        - players (list): A list of matching player rows, ordered by name.
+        """
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+
+        player_list = []
+        seen = set()
+        i = bisect_left(self._name_keys, prefix)
+        while i < len(self._name_keys) and self._name_keys[i].startswith(prefix):
+            player_id = self._name_ids[i]
+            if player_id not in seen:
+                seen.add(player_id)
+                player_list.append(self.players[player_id])
+                if len(player_list) >= limit:
+                    break
+            i += 1
+
+        return player_list
+
+    def search_fuzzy(self, name: str, limit: int = 10, cutoff: float = 0.6):
+        """
+        Finds players whose name is close to the given name, tolerating typos.
+
+        Parameters:
+        - name (str): The name to search for.
+        - limit (int): The maximum number of players to return. Default is 10.
+        - cutoff (float): The minimum similarity score between 0 and 1. Default is 0.6.
+
+        Returns:
+        - players (list): A list of matching player rows, best match first.
+        """
+        key = normalize_name(name)
+        if not key:
+            return []
+
+        # Exact and prefix hits are always the best matches
+        player_list = self.search_prefix(key, limit=limit)
+        seen = {x['player_id'] for x in player_list}
+
+        for match in difflib.get_close_matches(key, self._fuzzy_keys, n=limit, cutoff=cutoff):
+            for player_id in self._fuzzy_ids[match]:
+                if player_id not in seen:
+                    seen.add(player_id)
+                    player_list.append(self.players[player_id])
+
+        return player_list[:limit]
+
+    def add_player_info(self, df: pl.DataFrame, roles: list = ['batter', 'pitcher']):
+        """
+        Adds player names, positions and handedness to a pitch DataFrame in a single join per role.
+
+        For each role the columns {role}_name, {role}_position and {role}_hand are added.
+        Columns that already exist in the DataFrame are only filled where they are null.
+
+        Parameters:
+        - df (pl.DataFrame): A DataFrame with {role}_id columns, such as the output of get_data_df.
+        - roles (list): The roles to enrich. Default is ['batter', 'pitcher'].
+
+        Returns:
+        - df (pl.DataFrame): The DataFrame with the player columns added.
+        """
+        hand_column = {'batter': 'bat_side', 'pitcher': 'pitch_hand'}
+
+        for role in roles:
+            # Map the player table columns onto the names used in the pitch DataFrame
+            column_map = {'name': f'{role}_name', 'position': f'{role}_position'}
+            if hand_column.get(role) in self.player_df.columns:
+                column_map[hand_column[role]] = f'{role}_hand'
+
+            lookup_df = self.player_df.select(['player_id'] + list(column_map)).unique(subset=['player_id'])
+            lookup_df = lookup_df.rename({k: f'{v}_index' for k, v in column_map.items()})
+
+            df = df.join(lookup_df, left_on=f'{role}_id', right_on='player_id', how='left')
+            df = df.with_columns([
+                pl.coalesce([pl.col(v), pl.col(f'{v}_index')]).alias(v) if v in df.columns
+                else pl.col(f'{v}_index').alias(v)
+                for v in column_map.values()
+            ]).drop([f'{v}_index' for v in column_map.values()])
+
+        return df
+
+    def add_team_info(self, df: pl.DataFrame, id_columns: list = ['batter_team_id', 'pitcher_team_id']):
+        """
+        Adds team names, leagues and parent organizations to a DataFrame in a single join per column.
+
+        For a column named {prefix}_id the columns {prefix}_name, {prefix}_abbreviation,
+        {prefix}_league_name and {prefix}_parent_org_abbreviation are added.
+
+        Parameters:
+        - df (pl.DataFrame): A DataFrame with team ID columns, such as the output of get_data_df.
+        - id_columns (list): The team ID columns to enrich. Default is ['batter_team_id', 'pitcher_team_id'].
+
+        Returns:
+        - df (pl.DataFrame): The DataFrame with the team columns added.
+        """
+        team_columns = ['name', 'abbreviation', 'league_name', 'parent_org_abbreviation']
+
+        for id_column in id_columns:
+            prefix = id_column[:-3] if id_column.endswith('_id') else id_column
+            lookup_df = self.team_df.select(['team_id'] + team_columns).unique(subset=['team_id'])
+            lookup_df = lookup_df.rename({x: f'{prefix}_{x}' for x in team_columns})
+
+            # Skip columns the DataFrame already has, such as batter_team from get_data_df
+            lookup_df = lookup_df.select(['team_id'] + [x for x in lookup_df.columns[1:] if x not in df.columns])
+            df = df.join(lookup_df, left_on=id_column, right_on='team_id', how='left')
+
+        return df
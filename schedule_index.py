@@ -0,0 +1,144 @@
+import os
+from datetime import datetime, timedelta
+import polars as pl
+from pytz import timezone
+from api_scraper import MLB_Scrape
+
+# Coded game states from the schedule endpoint
+FINAL_STATES = ['F', 'O']
+POSTPONED_STATES = ['D', 'C', 'U']
+
+SNAPSHOT_COLUMNS = ['game_id', 'state', 'date', 'gameday_type']
+
+
+class Schedule_Index:
+
+    def __init__(self,
+                 sport_id: list = [1],
+                 game_type: list = ['R'],
+                 path: str = 'cache/schedule/schedule_snapshot.parquet',
+                 scraper: MLB_Scrape = None):
+        """
+        Keeps the last known snapshot of the schedule and diffs it against a small window of
+        freshly fetched games, so nightly jobs only need to ingest the games that changed.
+
+        Parameters:
+        - sport_id (list): A list of sport IDs to track. Default is [1].
+        - game_type (list): A list of game types to track. Default is ['R'].
+        - path (str): The Parquet file where the snapshot is persisted. Default is 'cache/schedule/schedule_snapshot.parquet'.
+        - scraper (MLB_Scrape): The scraper used to fetch the schedule. A new one is created if not provided.
+        """
+        self.sport_id = sport_id
+        self.game_type = game_type
+        self.path = path
+        self.scraper = scraper if scraper is not None else MLB_Scrape()
+
+        if os.path.exists(self.path):
+            self.snapshot_df = pl.read_parquet(self.path)
+        else:
+            self.snapshot_df = pl.DataFrame(schema={'game_id': pl.Int64,
+                                                    'state': pl.String,
+                                                    'date': pl.Date,
+                                                    'gameday_type': pl.String})
+
+    def save(self):
+        """
+        Persists the current snapshot to disk.
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.snapshot_df.write_parquet(self.path)
+
+    def fetch_window(self, days_back: int = 3, days_ahead: int = 1, today: str = None):
+        """
+        Fetches the schedule for a window of dates around today.
+
+        Parameters:
+        - days_back (int): The number of days before today to include. Default is 3.
+        - days_ahead (int): The number of days after today to include. Default is 1.
+        - today (str): The reference date (YYYY-MM-DD). Default is the current date in US/Eastern.
+
+        Returns:
+        - window_df (pl.DataFrame): The snapshot columns for every game in the window.
+        """
+        if today is None:
+            today_date = datetime.now(timezone('US/Eastern')).date()
+        else:
+            today_date = datetime.strptime(today, '%Y-%m-%d').date()
+
+        start_date = today_date - timedelta(days=days_back)
+        end_date = today_date + timedelta(days=days_ahead)
+
+        game_df = self.scraper.get_schedule(year_input=sorted({start_date.year, end_date.year}),
+                                            sport_id=self.sport_id,
+                                            game_type=self.game_type,
+                                            start_date=start_date.strftime('%Y-%m-%d'),
+                                            end_date=end_date.strftime('%Y-%m-%d'))
+
+        if game_df is None:
+            return self.snapshot_df.clear()
+
+        # Keep one row per game, the latest date, so a postponed game listed on both its original
+        # and makeup dates gives the same row on every run
+        game_df = game_df.sort(['game_id', 'date']).unique(subset='game_id', keep='last', maintain_order=True)
+
+        return game_df.select(SNAPSHOT_COLUMNS).cast(self.snapshot_df.schema)
+
+    def diff(self, window_df: pl.DataFrame):
+        """
+        Compares a window of games against the stored snapshot.
+
+        Parameters:
+        - window_df (pl.DataFrame): The freshly fetched games, as returned by fetch_window.
+
+        Returns:
+        - diff (dict): A dictionary of DataFrames with the previous and current state of each game:
+            - 'new': games that are not in the snapshot.
+            - 'state_changed': known games whose state changed.
+            - 'postponed': known games that moved into a postponed, cancelled or suspended state.
+            - 'rescheduled': known games whose date changed.
+            - 'completed': games that are now final and were not final in the snapshot, i.e. the games to ingest.
+        """
+        previous_df = self.snapshot_df.rename({x: f'{x}_previous' for x in SNAPSHOT_COLUMNS[1:]})
+        joined_df = window_df.join(previous_df, on='game_id', how='left')
+
+        is_new = pl.col('state_previous').is_null()
+        state_changed = ~is_new & (pl.col('state') != pl.col('state_previous'))
+        date_changed = ~is_new & (pl.col('date') != pl.col('date_previous'))
+
+        # A game moving from Game Over to Final was already reported as completed
+        was_not_final = is_new | ~pl.col('state_previous').is_in(FINAL_STATES)
+
+        return {
+            'new': joined_df.filter(is_new),
+            'state_changed': joined_df.filter(state_changed),
+            'postponed': joined_df.filter(state_changed & pl.col('state').is_in(POSTPONED_STATES)),
+            'rescheduled': joined_df.filter(date_changed),
+            'completed': joined_df.filter(was_not_final & pl.col('state').is_in(FINAL_STATES)),
+        }
+
+    def update(self, days_back: int = 3, days_ahead: int = 1, today: str = None, save: bool = True):
+        """
+        Fetches the window around today, diffs it against the snapshot and stores the new snapshot.
+
+        Parameters:
+        - days_back (int): The number of days before today to include. Default is 3.
+        - days_ahead (int): The number of days after today to include. Default is 1.
+        - today (str): The reference date (YYYY-MM-DD). Default is the current date in US/Eastern.
+        - save (bool): Persist the updated snapshot to disk. Default is True.
+
+        Returns:
+        - diff (dict): A dictionary of DataFrames, see diff.
+        """
+        window_df = self.fetch_window(days_back=days_back, days_ahead=days_ahead, today=today)
+        diff = self.diff(window_df)
+
+        # Replace the snapshot rows of every game seen in the window
+        self.snapshot_df = pl.concat([
+            self.snapshot_df.filter(~pl.col('game_id').is_in(window_df['game_id'].to_list())),
+            window_df,
+        ]).sort(['date', 'game_id'])
+
+        if save:
+            self.save()
+
+        return diff
@@ -0,0 +1,219 @@
+import os
+import re
+import glob
+from collections import OrderedDict
+import polars as pl
+from frame_cache import Frame_Cache
+
+
+class MLB_Query:
+
+    def __init__(self,
+                 frame_dir: str = 'cache/frames',
+                 schedule_path: str = 'cache/schedule/schedule_snapshot.parquet',
+                 index_dir: str = 'cache/index',
+                 cache_size: int = 32):
+        """
+        SQL entry point over the stored pitch, schedule, team and player tables.
+
+        Every table is registered in a Polars SQL context as a lazy scan, so a query only
+        reads the columns and rows it needs and the full dataset is never materialized.
+
+        Registered tables:
+        - pitches: the parsed game frames stored by Frame_Cache for the current parser.
+        - schedule: the schedule snapshot stored by Schedule_Index.
+        - players, teams: the tables stored by MLB_Index, with season, sport_id and game_type columns added.
+
+        Parameters:
+        - frame_dir (str): The Frame_Cache directory. Default is 'cache/frames'.
+        - schedule_path (str): The Schedule_Index snapshot file. Default is 'cache/schedule/schedule_snapshot.parquet'.
+        - index_dir (str): The MLB_Index directory. Default is 'cache/index'.
+        - cache_size (int): The number of query results to keep in memory. Default is 32.
+        """
+        self.frame_cache = Frame_Cache(cache_dir=frame_dir)
+        self.schedule_path = schedule_path
+        self.index_dir = index_dir
+        self.cache_size = cache_size
+
+        self.tables = {}
+        self._manifest = {}
+        self._results = OrderedDict()
+
+    def register(self, name: str, source):
+        """
+        Registers an additional table.
+
+        Parameters:
+        - name (str): The table name to use in SQL.
+        - source (str | pl.DataFrame | pl.LazyFrame): A Parquet or Arrow IPC file path or glob, or a frame.
+        """
+        if isinstance(source, str):
+            if source.endswith(('.arrow', '.ipc', '.feather')):
+                source = pl.scan_ipc(source, memory_map=True)
+            else:
+                source = pl.scan_parquet(source)
+        self.tables[name] = source.lazy()
+        self._results.clear()
+
+    def _update_manifest(self, file_list: list):
+        """
+        Records the dates, pitchers, batters and pitch types of every cached game file.
+
+        Only the four columns are read from each memory-mapped file, and each file is read again only when it changes.
+        """
+        for path in file_list:
+            mtime = os.stat(path).st_mtime_ns
+            if path in self._manifest and self._manifest[path]['mtime'] == mtime:
+                continue
+            df = pl.read_ipc(path, columns=['game_date', 'pitcher_id', 'batter_id', 'pitch_type'], memory_map=True)
+            self._manifest[path] = {
+                'mtime': mtime,
+                'min_date': df['game_date'].min(),
+                'max_date': df['game_date'].max(),
+                'pitcher_id': set(df['pitcher_id'].drop_nulls().to_list()),
+                'batter_id': set(df['batter_id'].drop_nulls().to_list()),
+                'pitch_type': set(df['pitch_type'].drop_nulls().to_list()),
+            }
+
+    def _scan_pitches(self, game_date=None, pitcher_id=None, batter_id=None, pitch_type=None):
+        """
+        Builds the lazy pitch table, skipping game files that can not match the filters.
+
+        Returns:
+        - lf (pl.LazyFrame): The lazy pitch table, empty if no game matches the filters, or None if no games are cached.
+        """
+        file_list = sorted(glob.glob(os.path.join(self.frame_cache.version_dir, '*.arrow')))
+        self._update_manifest(file_list)
+
+        start_date, end_date = (game_date, game_date) if isinstance(game_date, str) else (game_date or (None, None))
+        id_filters = {'pitcher_id': pitcher_id, 'batter_id': batter_id, 'pitch_type': pitch_type}
+        id_filters = {k: set(v) if isinstance(v, (list, tuple, set)) else {v} for k, v in id_filters.items() if v is not None}
+
+        # Prune the files using the manifest before anything is scanned
+        scan_list = []
+        for path in file_list:
+            entry = self._manifest[path]
+            if entry['max_date'] is None:
+                continue
+            if start_date and entry['max_date'] < start_date:
+                continue
+            if end_date and entry['min_date'] > end_date:
+                continue
+            if any(entry[k].isdisjoint(v) for k, v in id_filters.items()):
+                continue
+            scan_list.append(pl.scan_ipc(path, memory_map=True))
+
+        if len(file_list) == 0:
+            return None
+
+        # Keep the table registered with the pitch columns when every game is skipped
+        if len(scan_list) == 0:
+            return pl.scan_ipc(file_list[0], memory_map=True).head(0)
+
+        # Games can infer different types for columns that are entirely null
+        lf = pl.concat(scan_list, how='vertical_relaxed')
+
+        # Apply the same filters to the rows, these are pushed into each scan
+        if start_date:
+            lf = lf.filter(pl.col('game_date') >= start_date)
+        if end_date:
+            lf = lf.filter(pl.col('game_date') <= end_date)
+        for column, values in id_filters.items():
+            lf = lf.filter(pl.col(column).is_in(list(values)))
+
+        return lf
+
+    def _scan_index(self, table: str):
+        """
+        Builds a lazy table from every season, sport and game type persisted by MLB_Index.
+
+        The same player or team can be stored for several sports or game types of a season, so
+        the columns parsed from the file name identify which file each row came from.
+
+        Returns:
+        - lf (pl.LazyFrame): The lazy table with season, sport_id and game_type columns, or None if nothing is stored.
+        """
+        scan_list = []
+        for path in sorted(glob.glob(os.path.join(self.index_dir, f'{table}_*.parquet'))):
+            match = re.match(rf'{table}_(\d+)_(\d+)_(.+)\.parquet$', os.path.basename(path))
+            if match is None:
+                continue
+            scan_list.append(pl.scan_parquet(path).with_columns(
+                pl.lit(int(match.group(1))).alias('season'),
+                pl.lit(int(match.group(2))).alias('sport_id'),
+                pl.lit(match.group(3)).alias('game_type')))
+
+        if len(scan_list) == 0:
+            return None
+
+        # Spring training players come from a different endpoint with fewer columns
+        return pl.concat(scan_list, how='diagonal_relaxed')
+
+    def _state(self):
+        """Returns a token that changes whenever a stored table changes."""
+        path_list = [self.frame_cache.version_dir, self.schedule_path, self.index_dir]
+        path_list += glob.glob(os.path.join(self.index_dir, '*.parquet'))
+        return tuple((path, os.stat(path).st_mtime_ns) for path in path_list if os.path.exists(path))
+
+    def context(self, game_date=None, pitcher_id=None, batter_id=None, pitch_type=None):
+        """
+        Builds a Polars SQL context with every available table registered.
+
+        Parameters:
+        - game_date (str | tuple): A date (YYYY-MM-DD) or a (start, end) range of dates to restrict the pitch table to. Default is None.
+        - pitcher_id (int | list): One or more pitcher IDs to restrict the pitch table to. Default is None.
+        - batter_id (int | list): One or more batter IDs to restrict the pitch table to. Default is None.
+        - pitch_type (str | list): One or more pitch type codes to restrict the pitch table to. Default is None.
+
+        Returns:
+        - ctx (pl.SQLContext): The SQL context.
+        """
+        frames = {
+            'pitches': self._scan_pitches(game_date=game_date, pitcher_id=pitcher_id, batter_id=batter_id, pitch_type=pitch_type),
+            'schedule': pl.scan_parquet(self.schedule_path) if os.path.exists(self.schedule_path) else None,
+            'players': self._scan_index('players'),
+            'teams': self._scan_index('teams'),
+        }
+        frames = {k: v for k, v in frames.items() if v is not None}
+        frames.update(self.tables)
+
+        return pl.SQLContext(frames=frames)
+
+    def query(self, sql: str, game_date=None, pitcher_id=None, batter_id=None, pitch_type=None, use_cache: bool = True):
+        """
+        Runs a SQL query over the stored tables.
+
+        Filters on game_date, pitcher_id, batter_id and pitch_type skip whole game files before
+        they are scanned. Filters written in the SQL itself are still pushed into the scans by Polars.
+
+        Parameters:
+        - sql (str): The SQL query, e.g. "SELECT pitch_type, AVG(start_speed) FROM pitches GROUP BY pitch_type".
+        - game_date (str | tuple): A date (YYYY-MM-DD) or a (start, end) range of dates. Default is None.
+        - pitcher_id (int | list): One or more pitcher IDs. Default is None.
+        - batter_id (int | list): One or more batter IDs. Default is None.
+        - pitch_type (str | list): One or more pitch type codes. Default is None.
+        - use_cache (bool): Reuse the result of an identical earlier query if the stored tables did not change. Default is True.
+
+        Returns:
+        - df (pl.DataFrame): The query result.
+        """
+        def freeze(value):
+            return tuple(sorted(value)) if isinstance(value, (list, set)) else value
+
+        key = (' '.join(sql.split()),
+               freeze(game_date), freeze(pitcher_id), freeze(batter_id), freeze(pitch_type),
+               self._state())
+
+        if use_cache and key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+
+        ctx = self.context(game_date=game_date, pitcher_id=pitcher_id, batter_id=batter_id, pitch_type=pitch_type)
+        df = ctx.execute(sql).collect()
+
+        if use_cache and self.cache_size > 0:
+            self._results[key] = df
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+        return df
@@ -0,0 +1,167 @@
+import numpy as np
+import polars as pl
+
+# Half the width of home plate in feet, the horizontal edge of the strike zone
+PLATE_HALF_WIDTH = 17 / 2 / 12
+
+# Per-pitch values summed into each bin by default, as expressions on get_data_df columns
+DEFAULT_VALUES = {
+    'swing': pl.col('is_swing').fill_null(False).cast(pl.Float64),
+    'whiff': pl.col('is_whiff').fill_null(False).cast(pl.Float64),
+    'strike': pl.col('is_strike').fill_null(False).cast(pl.Float64),
+    'in_play': pl.col('in_play').fill_null(False).cast(pl.Float64),
+    'batted': pl.col('launch_speed').is_not_null().cast(pl.Float64),
+    'launch_speed': pl.col('launch_speed').fill_null(0).cast(pl.Float64),
+    'launch_angle': pl.col('launch_angle').fill_null(0).cast(pl.Float64),
+}
+
+
+class Zone_Heatmaps:
+
+    def __init__(self, by: list, labels: dict, tensors: dict, x_edges: np.ndarray, z_edges: np.ndarray):
+        """
+        Dense count and sum tensors of pitch locations, as built by Zone_Binner.aggregate.
+
+        Every tensor has one axis per grouping column followed by the (z, x) grid of the zone.
+
+        Parameters:
+        - by (list): The grouping columns, in axis order.
+        - labels (dict): The sorted labels of each grouping column, as NumPy arrays.
+        - tensors (dict): The tensors keyed by name. 'count' holds the number of pitches.
+        - x_edges (np.ndarray): The horizontal bin edges, in plate half widths from the middle of the plate.
+        - z_edges (np.ndarray): The vertical bin edges, in strike zone half heights from the middle of the zone.
+        """
+        self.by = by
+        self.labels = labels
+        self.tensors = tensors
+        self.x_edges = x_edges
+        self.z_edges = z_edges
+
+    def get(self, name: str = 'count', **selection):
+        """
+        Returns the zone grid of a tensor for a selection of groups.
+
+        Grouping columns that are not selected are summed over.
+
+        Parameters:
+        - name (str): The tensor to read. Default is 'count'.
+        - **selection: A label or list of labels for any grouping column, e.g. pitcher_id=669373, pitch_type=['FF', 'SI'].
+
+        Returns:
+        - grid (np.ndarray): A (z_bins, x_bins) array, with the top of the zone in the last row.
+        """
+        tensor = self.tensors[name]
+
+        # Narrow the selected axes first so only the selected groups are summed
+        for axis, column in enumerate(self.by):
+            if column in selection:
+                values = selection[column] if isinstance(selection[column], (list, tuple)) else [selection[column]]
+                index = np.flatnonzero(np.isin(self.labels[column], values))
+                tensor = tensor.take(index, axis=axis)
+
+        return tensor.sum(axis=tuple(range(len(self.by))))
+
+    def rate(self, numerator: str, denominator: str = 'count', **selection):
+        """
+        Returns the ratio of two tensors on the zone grid, e.g. whiffs per swing.
+
+        Parameters:
+        - numerator (str): The tensor to divide, e.g. 'whiff'.
+        - denominator (str): The tensor to divide by. Default is 'count'.
+        - **selection: A label or list of labels for any grouping column. See get.
+
+        Returns:
+        - grid (np.ndarray): A (z_bins, x_bins) array, NaN where the denominator is 0.
+        """
+        num = self.get(numerator, **selection).astype(np.float64)
+        den = self.get(denominator, **selection).astype(np.float64)
+        return np.divide(num, den, out=np.full(num.shape, np.nan), where=den > 0)
+
+
+class Zone_Binner:
+
+    def __init__(self, x_bins: int = 12, z_bins: int = 12, extent: float = 2.0):
+        """
+        Assigns pitches to a grid of cells around a normalized strike zone.
+
+        The horizontal location px is divided by the plate half width and the vertical
+        location pz is scaled between sz_bot and sz_top, so the strike zone spans -1 to 1 on
+        both axes for every batter. The grid covers -extent to extent on both axes and pitches
+        outside it are counted in the edge cells.
+
+        Parameters:
+        - x_bins (int): The number of horizontal cells. Default is 12.
+        - z_bins (int): The number of vertical cells. Default is 12.
+        - extent (float): The half width of the grid in normalized units. Default is 2.0.
+        """
+        self.x_bins = x_bins
+        self.z_bins = z_bins
+        self.extent = extent
+        self.x_edges = np.linspace(-extent, extent, x_bins + 1)
+        self.z_edges = np.linspace(-extent, extent, z_bins + 1)
+
+    def assign(self, df: pl.DataFrame):
+        """
+        Adds the normalized location and grid cell of every pitch in one vectorized pass.
+
+        Pitches without a location or strike zone get null cells.
+
+        Parameters:
+        - df (pl.DataFrame): A DataFrame of pitches with px, pz, sz_top and sz_bot, such as the output of get_data_df.
+
+        Returns:
+        - df (pl.DataFrame): The DataFrame with x_norm, z_norm, x_bin, z_bin and zone_bin (z_bin * x_bins + x_bin) added.
+        """
+        zone_mid = (pl.col('sz_top') + pl.col('sz_bot')) / 2
+        zone_half = (pl.col('sz_top') - pl.col('sz_bot')) / 2
+
+        df = df.with_columns(
+            (pl.col('px') / PLATE_HALF_WIDTH).alias('x_norm'),
+            pl.when(zone_half > 0).then((pl.col('pz') - zone_mid) / zone_half).otherwise(None).alias('z_norm'))
+
+        df = df.with_columns(
+            ((pl.col('x_norm') + self.extent) / (2 * self.extent) * self.x_bins).floor().clip(0, self.x_bins - 1).cast(pl.Int64).alias('x_bin'),
+            ((pl.col('z_norm') + self.extent) / (2 * self.extent) * self.z_bins).floor().clip(0, self.z_bins - 1).cast(pl.Int64).alias('z_bin'))
+
+        return df.with_columns((pl.col('z_bin') * self.x_bins + pl.col('x_bin')).alias('zone_bin'))
+
+    def aggregate(self, df: pl.DataFrame, by: list = ['pitcher_id', 'pitch_type', 'batter_hand'], values: dict = None):
+        """
+        Builds dense count and sum tensors over every group and grid cell at once.
+
+        Each tensor is filled by a single np.bincount over a flat index of the group codes
+        and the cell, so the cost does not depend on the number of players.
+
+        Parameters:
+        - df (pl.DataFrame): A DataFrame of pitches, such as the output of get_data_df.
+        - by (list): The grouping columns, one tensor axis each. Default is ['pitcher_id', 'pitch_type', 'batter_hand'].
+        - values (dict): Per-pitch values to sum, as Polars expressions keyed by tensor name. Default is DEFAULT_VALUES.
+
+        Returns:
+        - heatmaps (Zone_Heatmaps): The tensors, with shape (groups of each by column..., z_bins, x_bins).
+        """
+        if values is None:
+            values = DEFAULT_VALUES
+
+        df = self.assign(df).drop_nulls(subset=by + ['zone_bin'])
+
+        # Dense codes of every grouping column, in the order of the sorted labels
+        labels = {column: df[column].unique().sort().to_numpy() for column in by}
+        code_df = df.select([pl.col(column).replace_strict(labels[column], np.arange(len(labels[column])), return_dtype=pl.Int64)
+                             for column in by] + ['zone_bin'])
+
+        shape = [len(labels[column]) for column in by] + [self.z_bins * self.x_bins]
+        flat_index = np.zeros(len(df), dtype=np.int64)
+        for column, size in zip(by + ['zone_bin'], shape):
+            # Cast explicitly, an empty frame gives an object array
+            flat_index = flat_index * size + code_df[column].to_numpy().astype(np.int64)
+
+        size = int(np.prod(shape))
+        grid_shape = [len(labels[column]) for column in by] + [self.z_bins, self.x_bins]
+
+        tensors = {'count': np.bincount(flat_index, minlength=size).reshape(grid_shape)}
+        value_df = df.select([expr.alias(name) for name, expr in values.items()])
+        for name in values:
+            tensors[name] = np.bincount(flat_index, weights=value_df[name].to_numpy().astype(np.float64), minlength=size).reshape(grid_shape)
+
+        return Zone_Heatmaps(by=list(by), labels=labels, tensors=tensors, x_edges=self.x_edges, z_edges=self.z_edges)